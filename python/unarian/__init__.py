@@ -8,6 +8,9 @@ from unarian.parser import (
     BuiltinType,
     special_tokens,
     builtin_functions,
+    import_keyword,
+    alias_keyword,
+    namespace_separator,
     
     Token,
     Expression,
@@ -18,23 +21,69 @@ from unarian.parser import (
     tokenize,
     read_expr,
     read_group,
+    read_import,
     read_lib,
     resolve_references,
     simplify_expr,
+    gen_struct_hash,
+    intern_expr,
+    get_chain_guard,
+    compute_guards,
+    compute_lib_guards,
+    has_side_effects,
+    link_module,
     parse_expr,
     parse_lib,
 )
 
+from unarian.symbolic import (
+    SymbolicError,
+    
+    get_root,
+    SymbolicInt,
+    compare,
+    get_difference,
+    power,
+    Affine,
+    Recurrence,
+    resolve_group,
+    get_chain_summary,
+    get_summary,
+)
+
 from unarian.interpreter import (
     InterpreterInternalError,
     InterpreterError,
+    NonTerminationError,
     
     main_function,
+    table_size,
+    
+    OutputSink,
+    BufferedSink,
+    CallbackSink,
+    get_output_sink,
+    
+    init_speculation_worker,
+    evaluate_speculative_branch,
+    SpeculationPool,
+    Speculation,
     
     gen_stack_trace,
     evaluate_builtin,
+    find_cycle,
+    iter_outputs,
     evaluate,
+    tabulate,
+    get_dependency_hash,
+    save_tables,
+    load_tables,
     run,
 )
 
-from unarian.interface import Unarian
\ No newline at end of file
+from unarian.interface import (
+    module_cache,
+    get_module_loader,
+    is_up_to_date,
+    Unarian,
+)
\ No newline at end of file
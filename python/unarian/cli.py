@@ -10,8 +10,11 @@ from unarian.parser import (
 from unarian.interpreter import (
     InterpreterInternalError,
     InterpreterError,
+    BufferedSink,
 )
 
+from unarian.symbolic import SymbolicError
+
 from unarian.interface import Unarian
 
 
@@ -33,8 +36,20 @@ def get_argparser():
         action='store_true',
         help='Evaluates or compiles with debugging. Defaults to false.')
     ap.add_argument('-d', '--depth', dest='depth',
-        default=10000,
+        default=10000, type=int,
         help='Evaluates or compiles with the specified maximum depth. Defaults to 10000.')
+    ap.add_argument('--detect-cycles', dest='detect_cycles',
+        action='store_true',
+        help='Evaluates with detection of non-terminating recursion. Defaults to false.')
+    ap.add_argument('-s', '--speculate', dest='speculate',
+        nargs='*', default=None, metavar='FUNCTION',
+        help='Evaluates later branches of the specified functions on worker processes while earlier branches run. If no functions are given, functions whose first branch fails after a long computation are chosen automatically. Defaults to no speculation.')
+    ap.add_argument('-y', '--symbolic', dest='symbolic',
+        action='store_true',
+        help='Evaluates functions with recognized closed forms directly and keeps astronomically large values in symbolic form. Defaults to false.')
+    ap.add_argument('-t', '--tabulate', dest='tabulate',
+        nargs='+', default=None, metavar='FUNCTION',
+        help='Precomputes lookup tables of the specified functions on small inputs, saved next to the source code file. Defaults to no tables.')
     ap.add_argument('-c', '--compile', dest='compile',
         nargs='?', default=False, const=True, type=pathlib.Path,
         help='If included, compile to the specified output file. If no file is given, compile to an auto-generated output file. Otherwise, don\'t compile. Incompatible with \'--input\'.')
@@ -50,13 +65,15 @@ def run(argv):
     try:
         # Load source code
         if args.file is None:
+            if args.tabulate is not None:
+                sys.exit(f'Cannot run with option \'--tabulate\' without a source code file.')
             prog = Unarian()
         elif not args.file.exists():
             sys.exit(f'Source code path {args.file} doesn\'t exist.')
         elif not args.file.is_file():
             sys.exit(f'Source code path {args.file} isn\'t a file.')
         else:
-            prog = Unarian.load_file(args.file)
+            prog = Unarian.load_file(args.file, tabulate=args.tabulate, max_depth=args.depth)
         
         # Get expression
         expr = prog.parse(args.expr)
@@ -67,6 +84,11 @@ def run(argv):
         # Get depth option
         depth = args.depth
         
+        # Get speculation option. No function names means automatic selection
+        speculate = args.speculate
+        if speculate is not None and len(speculate) == 0:
+            speculate = True
+        
         # Get compilation path
         if args.compile is False:
             compile = None
@@ -100,28 +122,37 @@ def run(argv):
         opts = {
             'debug': debug,
             'max_depth': depth,
+            'detect_cycles': args.detect_cycles,
+            'speculate': speculate,
+            'symbolic': args.symbolic,
         }
         
         # Run
         if compile is not None:
             sys.exit(f'Compilation not yet implemented.')
         elif input:
+            # Outputs are only flushed once per line of input
+            output = BufferedSink(sys.stdout)
             for line in sys.stdin:
                 for x in line.split():
                     try:
                         x = int(x)
                     except ValueError as e:
-                        print('-', end=' ', flush=True)
+                        print('-', end=' ')
                     else:
-                        y = prog.evaluate(expr, x, **opts)
-                        print(y if y is not None else '-', end=' ', flush=True)
-                print()
+                        y = prog.evaluate(expr, x, output=output, **opts)
+                        print(y if y is not None else '-', end=' ')
+                print(flush=True)
         else:
-            y = prog.evaluate(expr, **opts)
+            # Outputs are written in batches, and flushed when evaluation ends
+            y = prog.evaluate(expr, output=BufferedSink(sys.stdout), **opts)
             print(y if y is not None else '-')
         
     except ParserError as err:
-        print(err.msg, file=sys.stderr)
+        print(err, file=sys.stderr)
         
     except InterpreterError as err:
-        print(err.msg, file=sys.stderr)
+        print(err, file=sys.stderr)
+        
+    except SymbolicError as err:
+        print(err, file=sys.stderr)
@@ -1,6 +1,53 @@
+import pathlib
+
 from unarian import parser
 from unarian import interpreter
 
+#===============#
+# Module Loader #
+#===============#
+
+# Modules parsed for import directives, keyed by resolved path and options.
+# Each module records the modification times of the files it was parsed from.
+module_cache = dict()
+
+# Resolved paths of the modules currently being parsed
+loading_modules = set()
+
+def get_module_loader(directory, lib, **opts):
+    """
+    Returns a loader for parser.parse_lib that loads imported modules relative
+    to the given directory. The source files of every loaded module are added
+    to the sources of lib.
+    """
+    def loader(path, line):
+        path = pathlib.Path(directory, path).resolve()
+        if path in loading_modules:
+            raise parser.ParserError(line, f'Circular import of module {str(path)!r}.')
+        try:
+            module = Unarian.load_module(path, **opts)
+        except OSError as err:
+            raise parser.ParserError(line, f'Cannot import module {str(path)!r}: {err.strerror}.')
+        except parser.ParserError as err:
+            # Name the file the error is in, unless a nested import already did
+            if err.file is not None:
+                raise
+            raise parser.ParserError(err.line, err.err, file=path) from err
+        lib.sources.update(module.sources)
+        lib.modules.append(module)
+        return module
+    return loader
+
+def is_up_to_date(lib):
+    """
+    Checks whether none of the source files of a library have been modified
+    since it was parsed.
+    """
+    try:
+        return all(path.stat().st_mtime_ns == mtime for path, mtime in lib.sources.items())
+    except OSError:
+        return False
+
 #=========================#
 # User-Friendly Interface #
 #=========================#
@@ -9,24 +56,103 @@ class Unarian(dict):
     @classmethod
     def load(cls, text, **opts):
         lib = Unarian()
-        return parser.parse_lib(text, lib, **opts)
+        loader = get_module_loader(pathlib.Path.cwd(), lib, **opts)
+        return parser.parse_lib(text, lib, table=lib.table, loader=loader, **opts)
     
     @classmethod
-    def load_file(cls, filename, **opts):
+    def load_file(cls, filename, *, tabulate=None, size=None, max_depth=None, **opts):
+        """
+        Loads a library file. If tabulate lists function names, their lookup
+        tables are built with the given maximum depth, or reused from a
+        '.tables.json' file saved next to the library file.
+        """
+        lib = Unarian(name=filename)
+        path = pathlib.Path(filename).resolve()
+        lib.sources[path] = path.stat().st_mtime_ns
         with open(filename, 'r', encoding='utf-8') as file:
             text = file.read()
-        lib = Unarian(name=filename)
-        return parser.parse_lib(text, lib, **opts)
+        loader = get_module_loader(pathlib.Path(filename).parent, lib, **opts)
+        
+        # Imports of this file while it's being parsed are circular
+        loading_modules.add(path)
+        try:
+            parser.parse_lib(text, lib, table=lib.table, loader=loader, **opts)
+        finally:
+            loading_modules.discard(path)
+        if tabulate:
+            cache = pathlib.Path(filename).with_suffix('.tables.json')
+            lib.tabulate(tabulate, size, cache=cache, max_depth=max_depth)
+        return lib
+    
+    @classmethod
+    def load_module(cls, filename, **opts):
+        """
+        Loads a library file that is shared with every other importer using the
+        same options. The file is only parsed again if it or any of the modules
+        it imports, directly or indirectly, has been modified.
+        """
+        path = pathlib.Path(filename).resolve()
+        key = (path, tuple(sorted(opts.items())))
+        
+        if key in module_cache and is_up_to_date(module_cache[key]):
+            return module_cache[key]
+        
+        lib = cls.load_file(path, **opts)
+        module_cache[key] = lib
+        return lib
     
     def __init__(self, *args, name=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.name = name
+        self.table = dict()
+        # Modification times of the source files, including imported modules
+        self.sources = dict()
+        # Directly imported modules
+        self.modules = []
     
     def parse(self, text, **opts):
-        return parser.parse_expr(text, self, **opts)
+        return parser.parse_expr(text, self, table=self.table, **opts)
     
     def evaluate(self, obj, x=None, **opts):
         return interpreter.evaluate(self, obj, x, **opts)
     
+    def iter_outputs(self, obj, x=None, **opts):
+        return interpreter.iter_outputs(self, obj, x, **opts)
+    
+    def get_imported_names(self):
+        """
+        Returns the names of the functions shared with imported modules.
+        """
+        imported = {id(group) for module in self.modules for group in module.values()}
+        return {name for name, group in self.items() if id(group) in imported}
+    
+    def tabulate(self, names, size=None, *, cache=None, **opts):
+        """
+        Builds lookup tables for the named functions. If cache is a path, valid
+        tables of these functions with the right size are loaded from it, and
+        the result is saved back to it. Lookup tables are stored in the
+        functions themselves, so functions imported from other modules can't be
+        tabulated.
+        """
+        if size is None: size = interpreter.table_size
+        names = list(names)
+        imported = self.get_imported_names()
+        for name in names:
+            if name in imported:
+                raise interpreter.InterpreterError(None, None, f'Cannot tabulate function {name!r} imported from another module.')
+        
+        if cache is not None and pathlib.Path(cache).is_file():
+            loaded = interpreter.load_tables(self, cache, names, size)
+            names = [name for name in names if name not in loaded]
+        
+        if names:
+            interpreter.tabulate(self, names, size, **opts)
+            if cache is not None:
+                try:
+                    interpreter.save_tables(self, cache, exclude=imported)
+                except OSError:
+                    pass
+        return self
+    
     def run(self, x=None, **opts):
         return interpreter.run(self, x, **opts)
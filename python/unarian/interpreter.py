@@ -1,4 +1,11 @@
+import os
+import sys
+import json
+import array
+import multiprocessing
+
 from unarian.base import UnarianError
+from unarian.symbolic import get_summary
 
 from unarian.parser import (
     BuiltinType,
@@ -7,6 +14,8 @@ from unarian.parser import (
     Function,
     Group,
     
+    has_side_effects,
+    gen_struct_hash,
     parse_expr,
 )
 
@@ -20,6 +29,9 @@ from unarian.parser import (
 
 main_function = 'main'
 
+# Number of inputs tabulated by default
+table_size = 256
+
 
 
 
@@ -41,6 +53,181 @@ class InterpreterError(UnarianError):
         self.stack = stack
         self.x = x
 
+class NonTerminationError(InterpreterError):
+    def __init__(self, stack, x, start, end):
+        y, group, _, _ = stack[start]
+        names = []
+        for _, subgroup, _, _ in stack[start:end]:
+            if subgroup.name is not None and subgroup.name not in names:
+                names.append(subgroup.name)
+        names_str = ', '.join(repr(name) for name in names) or 'anonymous groups'
+        err = f'Detected non-terminating recursion on input {y} through {names_str} (frames {start} and {end}).'
+        super().__init__(stack, x, err)
+        self.start = start
+        self.end = end
+        self.names = names
+
+
+
+
+
+#==============#
+# Output Sinks #
+#==============#
+
+class OutputSink:
+    """
+    Destination for the values printed by the `!` builtin. Writes every value
+    to a file on its own line as soon as it is produced.
+    """
+    def __init__(self, file=None):
+        if file is None: file = sys.stdout
+        self.file = file
+    
+    def write(self, x):
+        print(x, file=self.file, flush=True)
+    
+    def flush(self):
+        pass
+
+class BufferedSink(OutputSink):
+    """
+    Collects printed values and writes them to a file in batches of `size`
+    lines. Flushing writes any pending values to the file, but leaves flushing
+    the file itself to the caller.
+    """
+    def __init__(self, file=None, *, size=None):
+        if size is None: size = 1024
+        super().__init__(file)
+        self.size = size
+        self.pending = []
+    
+    def write(self, x):
+        self.pending.append(str(x))
+        if len(self.pending) >= self.size:
+            self.flush()
+    
+    def flush(self):
+        if self.pending:
+            self.file.write('\n'.join(self.pending) + '\n')
+            self.pending.clear()
+
+class CallbackSink(OutputSink):
+    """
+    Passes every printed value to a callback as soon as it is produced.
+    """
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+    
+    def write(self, x):
+        self.callback(x)
+
+def get_output_sink(output=None):
+    """
+    Converts an output sink, callback, or file-like object into an output sink.
+    Files are written to unbuffered. Use a BufferedSink to batch writes.
+    """
+    if output is None:
+        return OutputSink(sys.stdout)
+    elif isinstance(output, OutputSink):
+        return output
+    elif hasattr(output, 'write'):
+        return OutputSink(output)
+    elif callable(output):
+        return CallbackSink(output)
+    else:
+        raise TypeError(f'Argument output must be an output sink, callable, or file, not {type(output)!r}.')
+
+
+
+
+
+#========================#
+# Speculative Evaluation #
+#========================#
+
+# Library and cancellation counter for evaluating branches in a worker process
+worker_state = None
+
+def init_speculation_worker(lib, cancelled):
+    global worker_state
+    worker_state = (lib, cancelled)
+
+def evaluate_speculative_branch(generation, name, r, y, opts):
+    """
+    Evaluates branch r of the named function on input y. Returns a status and
+    the result, so that errors are only raised if the branch is actually used.
+    Evaluation is interrupted once its speculation has been cancelled.
+    """
+    lib, cancelled = worker_state
+    if cancelled.value >= generation:
+        return 'cancelled', None
+    interrupt = lambda: cancelled.value >= generation
+    try:
+        return 'result', evaluate(lib, Group([lib[name].branches[r]]), y, interrupt=interrupt, **opts)
+    except UnarianError:
+        return 'error', None
+
+class SpeculationPool:
+    """
+    Worker processes shared by every speculation of an evaluation. Each
+    speculation is numbered, and cancelling it raises a counter shared with
+    the workers, which abandon the tasks of cancelled speculations.
+    """
+    def __init__(self, lib, *, workers=None):
+        if workers is None: workers = os.cpu_count() or 1
+        self.generation = 0
+        self.cancelled = multiprocessing.RawValue('q', 0)
+        self.pool = multiprocessing.Pool(
+            workers,
+            initializer=init_speculation_worker,
+            initargs=(lib, self.cancelled),
+        )
+    
+    def start(self, name, y, index, branches, opts):
+        """
+        Starts evaluating the given branches of the named function on input y,
+        for the group's frame at the given stack index.
+        """
+        self.generation += 1
+        results = {
+            r: self.pool.apply_async(evaluate_speculative_branch, (self.generation, name, r, y, opts))
+            for r in branches
+        }
+        return Speculation(self, self.generation, index, results)
+    
+    def cancel(self, generation):
+        self.cancelled.value = max(self.cancelled.value, generation)
+    
+    def close(self):
+        # Cancel everything, and terminate workers stuck in a single long step
+        self.cancel(self.generation)
+        self.pool.terminate()
+
+class Speculation:
+    """
+    Later branches of a group being evaluated on worker processes while the
+    group's frame at the given stack index evaluates its earlier branches.
+    """
+    def __init__(self, pool, generation, index, results):
+        self.pool = pool
+        self.generation = generation
+        self.index = index
+        self.results = results
+    
+    def get(self, r):
+        """
+        Waits for the speculative result of branch r, if there is one.
+        """
+        result = self.results.pop(r, None)
+        if result is None:
+            return 'missing', None
+        return result.get()
+    
+    def stop(self):
+        self.pool.cancel(self.generation)
+
 
 
 
@@ -85,7 +272,7 @@ def gen_stack_trace(stack, x, *, maxlen=None):
     yield f'{i}. Evaluated to {x}.'
     yield ''
 
-def evaluate_builtin(builtin, x, stack, *, debug=None):
+def evaluate_builtin(builtin, x, stack, *, debug=None, output=None):
     if debug is None: debug = True
     
     if builtin.type == BuiltinType.Increment:
@@ -94,20 +281,68 @@ def evaluate_builtin(builtin, x, stack, *, debug=None):
         return x - 1 if x > 0 else None
     elif builtin.type == BuiltinType.Print:
         if debug:
-            print(x)
+            if output is None:
+                print(x)
+            else:
+                output.write(x)
         return x
     elif builtin.type == BuiltinType.Trace:
         if debug:
+            # Keep previously printed values ahead of the stack trace
+            file = sys.stdout
+            if output is not None:
+                output.flush()
+                file = output.file
             for line in gen_stack_trace(stack, x):
-                print(line)
+                print(line, file=file)
         return x
     else:
         raise InterpreterInternalError(f'Unexpected builtin type {builtin.type!r}.')
 
-def evaluate(lib, obj=None, x=None, *, debug=None, max_depth=None):
+def find_cycle(stack):
+    """
+    Returns the indices of two frames evaluating the same group on the same
+    input, or None if there are none. Evaluation is deterministic, so the
+    later frame must eventually repeat the earlier one forever.
+    """
+    seen = dict()
+    for i, (y, group, _, _) in enumerate(stack):
+        key = (id(group), y)
+        if key in seen:
+            return seen[key], i
+        seen[key] = i
+    return None
+
+def iter_outputs(lib, obj=None, x=None, *, debug=None, max_depth=None, output=None,
+        detect_cycles=None, cycle_period=None, speculate=None, workers=None,
+        speculate_after=None, symbolic=None, max_bits=None, interrupt=None):
+    """
+    Generator that yields the values printed by the `!` builtin as they are
+    produced and returns the result of the evaluation. If given, the output
+    sink is flushed before printing stack traces.
+    
+    If speculate is a collection of function names, later branches of those
+    functions without side effects are evaluated on worker processes while
+    the earlier branches run. If speculate is True, a function is speculated
+    on once its first branch has failed after at least speculate_after steps.
+    Only one group is speculated on at a time, and the worker processes are
+    shared by the whole evaluation.
+    
+    If symbolic is True, calls to functions with a recognized closed form are
+    evaluated directly, and results with more than max_bits bits are kept as
+    symbolic values instead of ints.
+    
+    If given, interrupt is called periodically, and evaluation is aborted with
+    an error once it returns True.
+    """
     if x is None: x = 0
     if debug is None: debug = True
     if max_depth is None: max_depth = 20_000
+    if detect_cycles is None: detect_cycles = False
+    if cycle_period is None: cycle_period = 10_000
+    if speculate is None: speculate = False
+    if speculate_after is None: speculate_after = 100_000
+    if symbolic is None: symbolic = False
     
     if isinstance(obj, str):
         expr = parse_expr(obj, lib)
@@ -117,67 +352,299 @@ def evaluate(lib, obj=None, x=None, *, debug=None, max_depth=None):
         raise TypeError(f'Argument expr must be of type Expression, not {type(expr)!r}.')
     
     if isinstance(expr, Builtin):
-        return evaluate_builtin(expr, x, [], debug=debug)
+        if expr.type == BuiltinType.Print:
+            if debug:
+                yield x
+            return x
+        return evaluate_builtin(expr, x, [], debug=debug, output=output)
     elif isinstance(expr, Function):
-        stack = [(x, lib[expr.name], 0, 0)]
+        scope = lib if expr.lib is None else expr.lib
+        stack = [(x, scope[expr.name], 0, 0)]
     elif isinstance(expr, Group):
         stack = [(x, expr, 0, 0)]
     else:
         raise InterpreterInternalError(f'Unexpected object of type {type(expr)!r}.')
     
-    while len(stack) > 0:
-        if len(stack) > max_depth:
-            raise InterpreterError(stack, x, f'Exceeded maximum stack depth: {max_depth}.')
-        
-        y, group, r, c = stack.pop(-1)
-        
-        if y is None:
-            # Input is None. Return None
-            x = None
-            continue
-        
-        if r >= len(group.branches):
-            # All branches returned None. Return None
-            x = None
-            continue
-        
-        if x is None:
-            # Current branch returned None. Try next one with input y
-            stack.append((y, group, r + 1, 0))
-            x = y
-            continue
-        
-        if c >= len(group.branches[r]):
-            # Current branch returned value x. Return x
-            continue
-        
-        # Evaluate the next expression in the current branch.
-        expr = group.branches[r][c]
-        stack.append((y, group, r, c + 1))
-        
-        if isinstance(expr, Builtin):
-            # Evaluate a builtin.
-            x = evaluate_builtin(expr, x, stack, debug=debug)
+    if speculate:
+        # Workers look up speculated functions by name
+        names = {id(group): name for name, group in lib.items()}
+        if speculate is True:
+            # Functions whose first branch has been seen to fail slowly
+            speculative = set()
+            entered = dict()
+        else:
+            for name in speculate:
+                if name not in lib:
+                    raise InterpreterError(None, None, f'Cannot speculate on undefined function {name!r}.')
+            speculative = {id(lib[name]) for name in speculate}
+    
+    # Steps are only counted, and speculations only tracked, when needed, so
+    # that the loop stays lean without these options
+    counting = detect_cycles or bool(speculate) or interrupt is not None
+    speculating = bool(speculate)
+    
+    steps = 0
+    next_check = cycle_period
+    pool = None
+    speculation = None
+    
+    try:
+        while len(stack) > 0:
+            if len(stack) > max_depth:
+                # Report non-terminating recursion rather than its symptom
+                if detect_cycles:
+                    cycle = find_cycle(stack)
+                    if cycle is not None:
+                        raise NonTerminationError(stack, x, *cycle)
+                raise InterpreterError(stack, x, f'Exceeded maximum stack depth: {max_depth}.')
             
-        elif isinstance(expr, Function):
-            # Evaluate a function reference.
-            name = expr.name
-            if name not in lib:
-                raise InterpreterError(stack, x, f'Reference to undefined function: {name!r}.')
-            expr = lib[name]
-            stack.append((x, expr, 0, 0))
+            if counting:
+                steps += 1
+                if interrupt is not None and steps % 1024 == 0 and interrupt():
+                    raise InterpreterError(stack, x, f'Evaluation interrupted.')
+                
+                # Periodically look for repeated frames. The period grows with the
+                # stack so that scanning it costs O(1) amortized per step.
+                if detect_cycles and steps >= next_check:
+                    cycle = find_cycle(stack)
+                    if cycle is not None:
+                        raise NonTerminationError(stack, x, *cycle)
+                    next_check = steps + max(cycle_period, len(stack))
             
-        elif isinstance(expr, Group):
-            # Evaluate a subgroup.
-            stack.append((x, expr, 0, 0))
+            y, group, r, c = stack.pop(-1)
             
-        else:
-            raise InterpreterInternalError(f'Unexpected object of type {type(expr)!r}.')
+            if speculating and speculation is not None and len(stack) < speculation.index:
+                # The speculated group has returned. Cancel remaining branches
+                speculation.stop()
+                speculation = None
+            
+            if y is None:
+                # Input is None. Return None
+                x = None
+                continue
+            
+            if r >= len(group.branches):
+                # All branches returned None. Return None
+                x = None
+                continue
+            
+            if x is None:
+                if speculate is True and r == 0 and steps - entered.get(len(stack), steps) >= speculate_after:
+                    # The first branch failed slowly. Speculate on later calls
+                    speculative.add(id(group))
+                
+                # Current branch returned None. Try next one with input y
+                stack.append((y, group, r + 1, 0))
+                x = y
+                continue
+            
+            if c == 0:
+                if group.guards is not None and y < group.guards[r]:
+                    # Current branch is known to fail on input y. Try the next one
+                    stack.append((y, group, r + 1, 0))
+                    continue
+                
+                if speculating:
+                    if speculation is not None and len(stack) == speculation.index:
+                        status, result = speculation.get(r)
+                        if status == 'result' and result is None:
+                            # Current branch failed on a worker. Try the next one
+                            stack.append((y, group, r + 1, 0))
+                            continue
+                        elif status == 'result':
+                            # Current branch returned value result on a worker
+                            x = result
+                            continue
+                        # Otherwise evaluate the branch here
+                    
+                    if r == 0 and speculate is True:
+                        entered[len(stack)] = steps
+                    marked = r == 0 and speculation is None and id(group) in speculative and id(group) in names
+                    
+                    # Start evaluating later branches without side effects
+                    branches = []
+                    for i in range(1, len(group.branches)):
+                        if not marked:
+                            break
+                        if group.guards is not None and y < group.guards[i]:
+                            continue
+                        if debug and has_side_effects(Group([group.branches[i]]), lib):
+                            continue
+                        branches.append(i)
+                    
+                    if branches:
+                        opts = {
+                            'debug': False,
+                            'max_depth': max_depth - len(stack) - 1,
+                            'detect_cycles': detect_cycles,
+                            'cycle_period': cycle_period,
+                            'symbolic': symbolic,
+                            'max_bits': max_bits,
+                        }
+                        if pool is None:
+                            pool = SpeculationPool(lib, workers=workers)
+                        speculation = pool.start(names[id(group)], y, len(stack), branches, opts)
+            
+            if c >= len(group.branches[r]):
+                # Current branch returned value x. Return x
+                continue
+            
+            # Evaluate the next expression in the current branch.
+            expr = group.branches[r][c]
+            stack.append((y, group, r, c + 1))
+            
+            if isinstance(expr, Builtin):
+                # Evaluate a builtin. Increments and decrements are inlined,
+                # since they make up most steps
+                builtin_type = expr.type
+                if builtin_type is BuiltinType.Increment:
+                    x = x + 1
+                elif builtin_type is BuiltinType.Decrement:
+                    x = x - 1 if x > 0 else None
+                elif builtin_type is BuiltinType.Print:
+                    if debug:
+                        yield x
+                else:
+                    x = evaluate_builtin(expr, x, stack, debug=debug, output=output)
+                
+            elif isinstance(expr, Function):
+                # Evaluate a function reference.
+                name = expr.name
+                scope = lib if expr.lib is None else expr.lib
+                if name not in scope:
+                    raise InterpreterError(stack, x, f'Reference to undefined function: {name!r}.')
+                expr = scope[name]
+                
+                if expr.lookup is None and not symbolic:
+                    stack.append((x, expr, 0, 0))
+                elif expr.lookup is not None and x < len(expr.lookup):
+                    # Look up the result of a tabulated function
+                    y = expr.lookup[x]
+                    x = y if y >= 0 else None
+                else:
+                    summary = get_summary(expr, scope) if symbolic else None
+                    if summary is not None:
+                        # Evaluate a function with a closed form directly
+                        x = summary.apply(x, max_bits=max_bits)
+                    else:
+                        stack.append((x, expr, 0, 0))
+                
+            elif isinstance(expr, Group):
+                # Evaluate a subgroup.
+                stack.append((x, expr, 0, 0))
+                
+            else:
+                raise InterpreterInternalError(f'Unexpected object of type {type(expr)!r}.')
+        
+    finally:
+        if pool is not None:
+            pool.close()
     
     return x
 
-def run(lib, x=None, *, debug=None, max_depth=None):
+def evaluate(lib, obj=None, x=None, *, output=None, **opts):
+    output = get_output_sink(output)
+    gen = iter_outputs(lib, obj, x, output=output, **opts)
+    try:
+        while True:
+            output.write(next(gen))
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        output.flush()
+
+def tabulate(lib, names, size=None, **opts):
+    """
+    Tabulates the results of the named functions on inputs 0 to size - 1 in
+    a single pass. Each table is filled in increasing order of input, so
+    recursive calls on smaller inputs are already looked up.
+    """
+    if size is None: size = table_size
+    
+    for name in names:
+        if name not in lib:
+            raise InterpreterError(None, None, f'Cannot tabulate undefined function {name!r}.')
+        group = lib[name]
+        if has_side_effects(group, lib):
+            raise InterpreterError(None, None, f'Cannot tabulate function {name!r} with side effects.')
+        
+        group.lookup = None
+        lookup = array.array('q')
+        expr = Function(name, lib=lib)
+        for x in range(size):
+            y = evaluate(lib, expr, x, **opts)
+            if y is not None and y >= 2 ** 63:
+                raise InterpreterError(None, None, f'Cannot tabulate function {name!r}, result {y} is too large.')
+            lookup.append(y if y is not None else -1)
+            group.lookup = lookup
+    
+    return lib
+
+def get_dependency_hash(group, lib):
+    """
+    Returns a hash of a function and every function it references, which
+    changes whenever any of their definitions do. The source text of each
+    definition is hashed, so libraries parsed without interning can be hashed
+    too.
+    """
+    hashes = dict()
+    pending = [group]
+    while pending:
+        group = pending.pop()
+        if id(group) in hashes:
+            continue
+        hashes[id(group)] = (group.name or '', str(group))
+        for chain in group.branches:
+            for expr in chain:
+                if isinstance(expr, Function):
+                    scope = lib if expr.lib is None else expr.lib
+                    if expr.name in scope:
+                        pending.append(scope[expr.name])
+                elif isinstance(expr, Group):
+                    pending.append(expr)
+    return gen_struct_hash(*sorted(hashes.values(), key=repr))
+
+def save_tables(lib, filename, *, exclude=None):
+    """
+    Saves the lookup tables of a library to a JSON file, except those of the
+    functions named in exclude.
+    """
+    if exclude is None: exclude = set()
+    
+    tables = dict()
+    for name, group in lib.items():
+        if group.lookup is not None and name not in exclude:
+            tables[name] = {
+                'hash': get_dependency_hash(group, lib),
+                'values': group.lookup.tolist(),
+            }
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(tables, file)
+
+def load_tables(lib, filename, names=None, size=None):
+    """
+    Loads lookup tables saved by save_tables for the named functions, or all
+    functions if names is None. Tables are skipped if their function is
+    undefined or has changed since, or if they don't have the given size.
+    Returns the names of the loaded tables.
+    """
+    with open(filename, 'r', encoding='utf-8') as file:
+        tables = json.load(file)
+    
+    if names is not None:
+        tables = {name: tables[name] for name in names if name in tables}
+    if size is not None:
+        tables = {name: table for name, table in tables.items() if len(table['values']) == size}
+    
+    names = []
+    for name, table in tables.items():
+        if name in lib and table['hash'] == get_dependency_hash(lib[name], lib):
+            lib[name].lookup = array.array('q', table['values'])
+            names.append(name)
+    return names
+
+def run(lib, x=None, **opts):
     expr = main_function
     if expr not in lib:
         raise InterpreterError(None, None, f'Cannot find main function {expr!r}.')
-    return evaluate(lib, expr, x, debug=debug, max_depth=max_depth)
+    return evaluate(lib, expr, x, **opts)
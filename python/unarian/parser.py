@@ -1,4 +1,6 @@
 import enum
+import hashlib
+import pathlib
 
 from unarian.base import UnarianError
 
@@ -24,6 +26,10 @@ class BuiltinType(enum.Enum):
 
 comment_start = '#'
 
+import_keyword = 'import'
+alias_keyword = 'as'
+namespace_separator = '.'
+
 special_tokens = {
     '{' : TokenType.OpenGroup,
     '}' : TokenType.CloseGroup,
@@ -49,12 +55,16 @@ class ParserInternalError(UnarianError):
     pass
 
 class ParserError(UnarianError):
-    def __init__(self, line, err=None):
+    def __init__(self, line, err=None, *, file=None):
         line_str = '' if line is None else f' in line {line}'
+        if file is not None:
+            line_str = f' in {str(file)!r}' + ('' if line is None else f', line {line}')
         err_str = '.' if err is None else f': {err}'
         msg = f'Parser error{line_str}{err_str}'
         super().__init__(msg)
         self.line = line
+        self.err = err
+        self.file = file
 
 
 
@@ -75,7 +85,8 @@ class Token:
         return f'Token({self.string!r}, {self.type!r}, {self.line!r})'
 
 class Expression:
-    pass
+    # Structural hash, set when the expression is interned
+    struct_hash = None
 
 class Builtin(Expression):
     def __init__(self, name):
@@ -89,8 +100,10 @@ class Builtin(Expression):
         return f'Builtin({self.name!r}, {self.type!r})'
 
 class Function(Expression):
-    def __init__(self, name):
+    def __init__(self, name, *, lib=None):
         self.name = name
+        # Library the name is looked up in. If None, use the evaluating library
+        self.lib = lib
     
     def __str__(self):
         return self.name
@@ -102,6 +115,12 @@ class Group(Expression):
     def __init__(self, branches, *, name=None):
         self.branches = branches
         self.name = name
+        # Minimum input for each branch not to fail immediately, if known
+        self.guards = None
+        # Closed form of the group, False if it has none, or None if unknown
+        self.summary = None
+        # Results for inputs 0, 1, ..., with -1 for failure, if tabulated
+        self.lookup = None
     
     def __str__(self):
         outer = []
@@ -211,14 +230,50 @@ def read_group(tokens, i):
     
     return expr, i
 
-def read_lib(tokens, i, lib=None):
+def read_import(tokens, i):
     """
-    Reads a library from a tokens list starting at index i.
+    Reads an import directive `import <path> [as <namespace>]` from a tokens
+    list starting at index i. The namespace defaults to the stem of the path.
+    Returns the path, namespace, and the index of the first unused token.
+    """
+    tok, i = tokens[i], i + 1
+    path = tokens[i].string
+    i += 1
+    
+    if (i + 1 < len(tokens)
+            and tokens[i].type is TokenType.Name and tokens[i].string == alias_keyword
+            and tokens[i + 1].type is TokenType.Name):
+        namespace = tokens[i + 1].string
+        i += 2
+    else:
+        namespace = pathlib.PurePath(path).stem
+    
+    if namespace in builtin_functions:
+        raise ParserError(tok.line, f'Namespace {namespace!r} is built-in and cannot be used.')
+    
+    return path, namespace, i
+
+def read_lib(tokens, i, lib=None, *, imports=None):
+    """
+    Reads a library from a tokens list starting at index i. Import directives
+    are appended to imports as (path, namespace, line) tuples.
     Returns the library and the index of the first unused token.
     """
     if lib is None: lib = dict()
     
     while i < len(tokens):
+        tok = tokens[i]
+        
+        # An import keyword followed by a group is an ordinary function named
+        # 'import', otherwise it's an import directive
+        if (tok.type is TokenType.Name and tok.string == import_keyword
+                and i + 1 < len(tokens) and tokens[i + 1].type is TokenType.Name):
+            if imports is None:
+                raise ParserError(tok.line, f'Import directives are not supported here.')
+            path, namespace, i = read_import(tokens, i)
+            imports.append((path, namespace, tok.line))
+            continue
+        
         tok, i = tokens[i], i + 1
         
         if tok.type is not TokenType.Name:
@@ -242,7 +297,7 @@ def resolve_references(obj, lib=None):
         if obj.string in builtin_functions:
             return Builtin(obj.string)
         elif lib is None or obj.string in lib:
-            return Function(obj.string)
+            return Function(obj.string, lib=lib)
         else:
             raise ParserError(obj.line, f'Reference to undefined function: {obj.string!r}.')
         
@@ -321,11 +376,148 @@ def simplify_expr(expr, *, asgroups=None):
     else:
         raise ParserInternalError(f'Unexpected object of type {type(expr)!r}: {expr!r}.')
 
-def parse_expr(text, lib=None, *, simplify=None):
+def gen_struct_hash(*parts):
+    """
+    Returns a hash of the given parts that is stable across runs.
+    """
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def intern_expr(expr, table=None):
+    """
+    Recursively replaces structurally identical subexpressions and chains with
+    shared objects from table. Named groups keep their own object, so that
+    stack traces show their names, but share their list of branches with every
+    equivalent group. Per-group caches such as guards, summaries and lookup
+    tables are therefore not shared between equivalent named groups.
+    
+    Function references are hashed by name only, not by the body they refer
+    to, so structural hashes identify the shape of an expression rather than
+    its meaning. Use the hashes of the referenced functions as well when the
+    meaning matters. Returns the interned expression.
+    """
+    if table is None: table = dict()
+    
+    if isinstance(expr, Builtin) or isinstance(expr, Function):
+        key = (type(expr), expr.name, id(getattr(expr, 'lib', None)))
+        if key not in table:
+            expr.struct_hash = gen_struct_hash(type(expr).__name__, expr.name)
+            table[key] = expr
+        return table[key]
+        
+    elif isinstance(expr, Group):
+        branches = []
+        for chain in expr.branches:
+            chain = [intern_expr(subexpr, table) for subexpr in chain]
+            
+            # Children are interned, so their identities determine the chain
+            key = (list, tuple(id(subexpr) for subexpr in chain))
+            if key not in table:
+                table[key] = chain
+            branches.append(table[key])
+        
+        key = (Group, tuple(id(chain) for chain in branches))
+        if key not in table:
+            shared = expr if expr.name is None else Group(branches)
+            shared.branches = branches
+            shared.struct_hash = gen_struct_hash('Group', tuple(
+                tuple(subexpr.struct_hash for subexpr in chain) for chain in branches
+            ))
+            table[key] = shared
+        shared = table[key]
+        
+        if expr.name is not None:
+            # Named groups are kept distinct for stack traces, but are only a
+            # name wrapped around the branches of the shared unnamed group
+            expr.branches = shared.branches
+            expr.struct_hash = shared.struct_hash
+            return expr
+        return shared
+        
+    else:
+        raise ParserInternalError(f'Unexpected object of type {type(expr)!r}: {expr!r}.')
+
+def get_chain_guard(chain, lib=None):
+    """
+    Returns a lower bound on the inputs for which a chain can succeed. The
+    chain fails on smaller inputs before any side effects occur.
+    """
+    guard = 0
+    offset = 0
+    for expr in chain:
+        if isinstance(expr, Builtin):
+            if expr.type == BuiltinType.Increment:
+                offset += 1
+            elif expr.type == BuiltinType.Decrement:
+                guard = max(guard, 1 - offset)
+                offset -= 1
+            else:
+                # Don't skip past side effects
+                break
+            
+        else:
+            if isinstance(expr, Function):
+                scope = lib if expr.lib is None else expr.lib
+                group = scope.get(expr.name) if scope is not None else None
+            else:
+                group = expr
+            
+            # The output of a group is unknown, so stop after its guard
+            if group is not None and group.guards is not None:
+                guard = max(guard, min(group.guards) - offset)
+            break
+    
+    return guard
+
+def compute_guards(expr, lib=None, *, visited=None):
+    """
+    Recursively computes the guards of every branch of every group in an
+    expression, using the current guards of the functions it references.
+    Returns whether any guard changed.
+    """
+    if visited is None: visited = set()
+    
+    if not isinstance(expr, Group) or id(expr) in visited:
+        return False
+    visited.add(id(expr))
+    
+    changed = False
+    for chain in expr.branches:
+        for subexpr in chain:
+            changed |= compute_guards(subexpr, lib, visited=visited)
+    
+    guards = [get_chain_guard(chain, lib) for chain in expr.branches]
+    changed |= guards != expr.guards
+    expr.guards = guards
+    return changed
+
+def compute_lib_guards(lib, names=None, *, max_rounds=None):
+    """
+    Computes the guards of the named functions in a library, or of every
+    function if names is None. Guards only ever increase between rounds and
+    are valid after each one, so recursive functions whose guards never settle
+    are cut off after max_rounds.
+    """
+    if names is None: names = list(lib)
+    if max_rounds is None: max_rounds = 64
+    
+    for _ in range(max_rounds):
+        visited = set()
+        changed = False
+        for name in names:
+            changed |= compute_guards(lib[name], lib, visited=visited)
+        if not changed:
+            break
+    
+    return lib
+
+def parse_expr(text, lib=None, *, simplify=None, intern=None, table=None, guards=None):
     """
     Parses and returns an expression from string input.
     """
     if simplify is None: simplify = True
+    if intern is None: intern = True
+    if guards is None: guards = True
     
     # Tokenize and parse
     tokens = tokenize(text)
@@ -339,23 +531,87 @@ def parse_expr(text, lib=None, *, simplify=None):
     expr = resolve_references(expr, lib)
     if simplify:
         expr = simplify_expr(expr)
+    if intern:
+        expr = intern_expr(expr, table)
+    if guards:
+        compute_guards(expr, lib)
     
     return expr
 
-def parse_lib(text, lib=None, *, simplify=True):
+def has_side_effects(expr, lib=None, *, visited=None):
+    """
+    Returns whether evaluating an expression can reach a `!` or `@` builtin.
+    """
+    if visited is None: visited = set()
+    
+    if isinstance(expr, Builtin):
+        return expr.type in (BuiltinType.Print, BuiltinType.Trace)
+        
+    elif isinstance(expr, Function):
+        scope = lib if expr.lib is None else expr.lib
+        if scope is None or expr.name not in scope:
+            return False
+        return has_side_effects(scope[expr.name], lib, visited=visited)
+        
+    elif isinstance(expr, Group):
+        if id(expr) in visited:
+            return False
+        visited.add(id(expr))
+        return any(
+            has_side_effects(subexpr, lib, visited=visited)
+            for chain in expr.branches for subexpr in chain
+        )
+        
+    else:
+        raise ParserInternalError(f'Unexpected object of type {type(expr)!r}: {expr!r}.')
+
+def link_module(lib, module, namespace, line=None):
+    """
+    Adds every function of a separately parsed module to a library under the
+    given namespace. The functions are shared with the module, not copied, so
+    they keep the names they have in the module.
     """
-    Parses and returns a library from string input.
+    for name in module:
+        full_name = f'{namespace}{namespace_separator}{name}'
+        if full_name in lib:
+            raise ParserError(line, f'Function {full_name!r} already defined')
+        lib[full_name] = module[name]
+    return lib
+
+def parse_lib(text, lib=None, *, simplify=True, intern=None, table=None, guards=None, loader=None):
+    """
+    Parses and returns a library from string input. Import directives are
+    resolved by calling loader with the imported path and the line of the
+    directive, which must return the parsed module.
     """
     if simplify is None: simplify = True
+    if intern is None: intern = True
+    if intern and table is None: table = dict()
+    if guards is None: guards = True
     
     # Tokenize and parse
     tokens = tokenize(text)
-    lib, i = read_lib(tokens, 0, lib)
+    if lib is None: lib = dict()
+    existing = set(lib)
+    imports = []
+    lib, i = read_lib(tokens, 0, lib, imports=imports)
+    names = [name for name in lib if name not in existing]
+    
+    # Link imported modules
+    for path, namespace, line in imports:
+        if loader is None:
+            raise ParserError(line, f'Cannot import {path!r} without a module loader.')
+        link_module(lib, loader(path, line), namespace, line)
     
     # Clean up function definitions
-    for name in lib:
+    for name in names:
         lib[name] = resolve_references(lib[name], lib)
         if simplify:
             lib[name] = simplify_expr(lib[name], asgroups=True)
+        if intern:
+            lib[name] = intern_expr(lib[name], table)
+    
+    if guards:
+        compute_lib_guards(lib, names)
     
     return lib
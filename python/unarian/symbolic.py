@@ -0,0 +1,401 @@
+import sys
+import math
+import functools
+
+from unarian.base import UnarianError
+from unarian.parser import (
+    BuiltinType,
+    Builtin,
+    Function,
+    Group,
+)
+
+
+
+
+
+#===============#
+# Error Classes #
+#===============#
+
+class SymbolicError(UnarianError):
+    def __init__(self, a, b):
+        super().__init__(f'Symbolic error: Cannot compare {a} and {b} exactly.')
+        self.a = a
+        self.b = b
+
+
+
+
+
+#=================#
+# Symbolic Values #
+#=================#
+
+def get_root(n):
+    """
+    Returns the smallest root of an int n > 1 and its power k, so that
+    root ** k == n.
+    """
+    for k in range(n.bit_length(), 1, -1):
+        guess = round(n ** (1 / k))
+        for root in (guess - 1, guess, guess + 1):
+            if root > 1 and root ** k == n:
+                return root, k
+    return n, 1
+
+@functools.total_ordering
+class SymbolicInt:
+    """
+    An astronomically large natural number (coef * base ** exp + offset) / den,
+    where exp is an int or another symbolic value. Symbolic values are only
+    created when they have more than max_bits bits. Comparisons are exact, and
+    raise a SymbolicError when the values are too close to decide.
+    
+    Values are kept in a normal form, with the smallest possible base and no
+    factors of the base that can be moved into the exponent, so that equal
+    values have equal keys.
+    """
+    def __init__(self, coef, base, exp, offset=0, den=1):
+        if den < 0:
+            coef, offset, den = -coef, -offset, -den
+        g = math.gcd(coef, offset, den)
+        coef, offset, den = coef // g, offset // g, den // g
+        
+        # Rewrite perfect powers such as 4 ** n as 2 ** (2 * n)
+        base, k = get_root(base)
+        if k != 1:
+            exp = exp * k
+        
+        # Move factors of the base out of the coefficient and denominator
+        while den % base == 0 and offset % base == 0:
+            den, offset, exp = den // base, offset // base, exp - 1
+        while coef != 0 and coef % base == 0:
+            coef, exp = coef // base, exp + 1
+        
+        self.coef = coef
+        self.base = base
+        self.exp = exp
+        self.offset = offset
+        self.den = den
+    
+    def __str__(self):
+        exp_str = str(self.exp) if isinstance(self.exp, int) else f'({self.exp})'
+        s = f'{self.base}^{exp_str}'
+        if self.coef != 1:
+            s = f'{self.coef}*{s}'
+        if self.offset > 0:
+            s = f'{s} + {self.offset}'
+        elif self.offset < 0:
+            s = f'{s} - {-self.offset}'
+        if self.den != 1:
+            s = f'({s}) / {self.den}'
+        return s
+    
+    def __repr__(self):
+        return f'SymbolicInt({self.coef!r}, {self.base!r}, {self.exp!r}, {self.offset!r}, {self.den!r})'
+    
+    def get_key(self):
+        return (self.coef, self.base, self.exp, self.offset, self.den)
+    
+    def get_height(self):
+        """
+        Returns the height of the tower of exponentials.
+        """
+        return 1 + (self.exp.get_height() if isinstance(self.exp, SymbolicInt) else 0)
+    
+    def get_bit_bounds(self):
+        """
+        Returns bounds (lo, hi) with 2 ** lo <= self < 2 ** hi, which may be
+        symbolic, or None if the offset is too large to be bounded this way.
+        """
+        # Bounds of coef * base ** exp, exact for powers of two
+        bits = self.base.bit_length()
+        lo = self.exp * (bits - 1) + self.coef.bit_length() - 1
+        if self.base & (self.base - 1) == 0:
+            hi = lo + 1
+        else:
+            hi = self.exp * bits + self.coef.bit_length()
+        
+        # If |offset| < 2 ** (lo - 1), adding it at most halves or doubles it
+        if self.offset != 0:
+            if compare(abs(self.offset).bit_length() + 1, lo) != -1:
+                return None
+            lo, hi = lo - 1, hi + 1
+        if self.den != 1:
+            lo, hi = lo - self.den.bit_length(), hi + 1 - self.den.bit_length()
+        return lo, hi
+    
+    def compare_shifted(self, other, k):
+        """
+        Compares self with other, which has the same base and an exponent
+        larger by the int k. Returns -1, 0, 1 or None like compare.
+        """
+        if k < 0:
+            result = other.compare_shifted(self, -k)
+            return None if result is None else -result
+        
+        # The sign of the difference is the sign of a * base ** exp + b
+        p = self.coef * other.den
+        if k * (self.base.bit_length() - 1) > p.bit_length():
+            a = -1
+        else:
+            a = p - other.coef * self.den * self.base ** k
+        b = self.offset * other.den - other.offset * self.den
+        
+        if a == 0:
+            return (b > 0) - (b < 0)
+        # If |b| < base ** exp, the sign of a decides
+        if compare(abs(b).bit_length(), self.exp * (self.base.bit_length() - 1)) in (-1, 0):
+            return 1 if a > 0 else -1
+        return None
+    
+    def compare(self, other):
+        """
+        Returns -1, 0 or 1 if self is less than, equal to or greater than other,
+        or None if they can't be compared exactly.
+        """
+        if isinstance(other, SymbolicInt):
+            if self.get_key() == other.get_key():
+                return 0
+            if self.base == other.base:
+                k = get_difference(other.exp, self.exp)
+                if k is not None:
+                    return self.compare_shifted(other, k)
+            other_bounds = other.get_bit_bounds()
+        elif isinstance(other, int):
+            if other <= 0:
+                return 1
+            other_bounds = (other.bit_length() - 1, other.bit_length())
+        else:
+            return None
+        
+        # Compare by bit length if the bounds don't overlap
+        bounds = self.get_bit_bounds()
+        if bounds is not None and other_bounds is not None:
+            if compare(bounds[1], other_bounds[0]) in (-1, 0):
+                return -1
+            if compare(bounds[0], other_bounds[1]) in (0, 1):
+                return 1
+        
+        # An int of about the same size is small enough to compare exactly
+        if isinstance(other, int) and isinstance(self.exp, int):
+            a = self.coef * self.base ** self.exp + self.offset
+            b = other * self.den
+            return (a > b) - (a < b)
+        
+        # So are two values with int exponents and at most 2 ** 20 bits
+        if (isinstance(other, SymbolicInt) and isinstance(self.exp, int) and isinstance(other.exp, int)
+                and bounds is not None and other_bounds is not None
+                and max(bounds[1], other_bounds[1]) <= 1 << 20):
+            a = (self.coef * self.base ** self.exp + self.offset) * other.den
+            b = (other.coef * other.base ** other.exp + other.offset) * self.den
+            return (a > b) - (a < b)
+        return None
+    
+    def __hash__(self):
+        # Values with an int exponent may equal an int, so they hash like one.
+        # Ints are hashed by their residue modulo a prime, which can be found
+        # without expanding the value.
+        if isinstance(self.exp, int):
+            modulus = sys.hash_info.modulus
+            residue = (self.coef * pow(self.base, self.exp, modulus) + self.offset) % modulus
+            return hash(residue * pow(self.den, -1, modulus) % modulus)
+        return hash(self.get_key())
+    
+    def __eq__(self, other):
+        if not isinstance(other, SymbolicInt) and not isinstance(other, int):
+            return NotImplemented
+        result = self.compare(other)
+        if result is None:
+            raise SymbolicError(self, other)
+        return result == 0
+    
+    def __lt__(self, other):
+        if not isinstance(other, SymbolicInt) and not isinstance(other, int):
+            return NotImplemented
+        result = self.compare(other)
+        if result is None:
+            raise SymbolicError(self, other)
+        return result == -1
+    
+    def __add__(self, n):
+        if not isinstance(n, int):
+            return NotImplemented
+        return SymbolicInt(self.coef, self.base, self.exp, self.offset + n * self.den, self.den)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, n):
+        if not isinstance(n, int):
+            return NotImplemented
+        return self + (-n)
+    
+    def __mul__(self, n):
+        if not isinstance(n, int):
+            return NotImplemented
+        if n == 0:
+            return 0
+        return SymbolicInt(self.coef * n, self.base, self.exp, self.offset * n, self.den)
+    
+    __rmul__ = __mul__
+    
+    def __int__(self):
+        """
+        Expands to an int. Only possible if the exponent is an int, and even
+        then likely to be very slow.
+        """
+        if not isinstance(self.exp, int):
+            raise OverflowError(f'Symbolic value {self} is too large to expand.')
+        return (self.coef * self.base ** self.exp + self.offset) // self.den
+
+def compare(a, b):
+    """
+    Returns -1, 0 or 1 if a is less than, equal to or greater than b, where
+    both are ints or symbolic values, or None if they can't be compared exactly.
+    """
+    if isinstance(a, SymbolicInt):
+        return a.compare(b)
+    elif isinstance(b, SymbolicInt):
+        result = b.compare(a)
+        return None if result is None else -result
+    return (a > b) - (a < b)
+
+def get_difference(a, b):
+    """
+    Returns a - b as an int if it can be computed exactly, where both are ints
+    or symbolic values, and None otherwise.
+    """
+    if isinstance(a, int) and isinstance(b, int):
+        return a - b
+    elif isinstance(a, SymbolicInt) and isinstance(b, SymbolicInt):
+        if (a.coef, a.base, a.exp, a.den) == (b.coef, b.base, b.exp, b.den):
+            if (a.offset - b.offset) % a.den == 0:
+                return (a.offset - b.offset) // a.den
+    return None
+
+def power(coef, base, exp, offset=0, den=1, *, max_bits=None):
+    """
+    Returns (coef * base ** exp + offset) / den, as an int if it has at most
+    max_bits bits and symbolically otherwise.
+    """
+    if max_bits is None: max_bits = 1 << 16
+    
+    if coef == 0:
+        return offset // den
+    # Since base > 1, exponents larger than max_bits are always too large
+    if isinstance(exp, int) and exp <= max_bits and exp * math.log2(base) <= max_bits:
+        return (coef * base ** exp + offset) // den
+    return SymbolicInt(coef, base, exp, offset, den)
+
+
+
+
+
+#====================#
+# Function Summaries #
+#====================#
+
+class Affine:
+    """
+    Summary of a total function x -> a * x + b.
+    """
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+    
+    def __repr__(self):
+        return f'Affine({self.a!r}, {self.b!r})'
+    
+    def then(self, other):
+        """
+        Returns the summary of applying self and then other.
+        """
+        return Affine(other.a * self.a, other.a * self.b + other.b)
+    
+    def apply(self, x, *, max_bits=None):
+        return self.a * x + self.b
+
+class Recurrence:
+    """
+    Summary of a total function f(0) = c, f(n) = a * f(n - 1) + b with a > 1,
+    which has the closed form ((c * (a - 1) + b) * a ** n - b) / (a - 1).
+    """
+    def __init__(self, a, b, c):
+        self.a = a
+        self.b = b
+        self.c = c
+    
+    def __repr__(self):
+        return f'Recurrence({self.a!r}, {self.b!r}, {self.c!r})'
+    
+    def apply(self, x, *, max_bits=None):
+        a, b, c = self.a, self.b, self.c
+        return power(c * (a - 1) + b, a, x, -b, a - 1, max_bits=max_bits)
+
+def resolve_group(expr, lib=None):
+    """
+    Returns the group an expression evaluates, or None if it's undefined.
+    """
+    if isinstance(expr, Group):
+        return expr
+    elif isinstance(expr, Function):
+        scope = lib if expr.lib is None else expr.lib
+        if scope is None or expr.name not in scope:
+            return None
+        return scope[expr.name]
+    return None
+
+def get_chain_summary(chain, lib=None):
+    """
+    Returns the affine summary of a chain, or None if it can fail or have
+    side effects.
+    """
+    summary = Affine(1, 0)
+    for expr in chain:
+        if isinstance(expr, Builtin):
+            if expr.type != BuiltinType.Increment:
+                return None
+            summary = summary.then(Affine(1, 1))
+        else:
+            group = resolve_group(expr, lib)
+            sub = get_summary(group, lib) if group is not None else None
+            if not isinstance(sub, Affine):
+                return None
+            summary = summary.then(sub)
+    return summary
+
+def get_summary(group, lib=None):
+    """
+    Returns the closed form summary of a group, or None if it has none. Groups
+    with a single affine branch are affine. Groups of the form `- f A | B`,
+    where f is the group itself and A and B are affine, are recurrences. The
+    result is cached in the group.
+    """
+    if group.summary is not None:
+        return group.summary or None
+    
+    # Recursion through other groups has no summary
+    group.summary = False
+    summary = None
+    
+    if len(group.branches) == 1:
+        summary = get_chain_summary(group.branches[0], lib)
+    
+    elif len(group.branches) == 2:
+        chain = group.branches[0]
+        if (len(chain) >= 2
+                and isinstance(chain[0], Builtin) and chain[0].type == BuiltinType.Decrement
+                and resolve_group(chain[1], lib) is group):
+            step = get_chain_summary(chain[2:], lib)
+            base = get_chain_summary(group.branches[1], lib)
+            if step is not None and base is not None:
+                # The first branch only fails on 0, so f(0) = B(0)
+                c = base.b
+                if step.a == 1:
+                    summary = Affine(step.b, c)
+                elif step.a > 1:
+                    summary = Recurrence(step.a, step.b, c)
+    
+    group.summary = summary or False
+    return summary